@@ -248,52 +248,75 @@
       import os
       import sys
       import json
-      import time
       import hmac
-      import hashlib
       import base64
       import subprocess
       from pathlib import Path
-      from typing import Dict, Any
 
       import requests
-      from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+      from requests.adapters import HTTPAdapter
+      from urllib3.util.retry import Retry
+      from cryptography.hazmat.primitives.ciphers.aead import AESGCM
       from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
-      from cryptography.hazmat.primitives import hashes
+      try:
+          # Optional; not part of the image's Python package set
+          import orjson
+          _json_dumps, _json_loads = orjson.dumps, orjson.loads
+      except ImportError:
+          def _json_dumps(obj):
+              return json.dumps(obj, separators=(',', ':')).encode()
+          _json_loads = json.loads
+
+      _JSON_HEADERS = {"Content-Type": "application/json"}
 
       class BootstrapClient:
           def __init__(self, server_url: str, psk: str):
               self.server_url = server_url.rstrip('/')
               self.psk = psk.encode() if isinstance(psk, str) else psk
+              # Derived keys per serial; Scrypt is deliberately expensive
+              self._key_cache = {}
+              # One keep-alive pool for /register and /confirm. Quick retries
+              # ride out short blips; the shell loop around this script
+              # handles longer outages with RETRY_DELAY.
+              retry = Retry(total=3, backoff_factor=0.2, status_forcelist=(502, 503, 504),
+                            allowed_methods=frozenset(['GET', 'POST']), raise_on_status=False)
+              adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+              self._session = requests.Session()
+              self._session.mount('http://', adapter)
+              self._session.mount('https://', adapter)
 
           def _create_signature(self, data: str):
               """Create HMAC signature for data (simplified - no timestamp)"""
-              signature = hmac.new(self.psk, data.encode(), hashlib.sha256).hexdigest()
-              return signature
+              # One-shot HMAC in C; each run signs only once or twice
+              return hmac.digest(self.psk, data.encode(), 'sha256').hex()
 
           def _derive_device_key(self, device_serial: str):
-              salt = device_serial.encode().ljust(32, b'\x00')[:32]
-              kdf = Scrypt(length=32, salt=salt, n=2**14, r=8, p=1)
-              return kdf.derive(self.psk)
+              key = self._key_cache.get(device_serial)
+              if key is None:
+                  # Must match the service's KDF, so Scrypt stays
+                  salt = device_serial.encode().ljust(32, b'\x00')[:32]
+                  kdf = Scrypt(length=32, salt=salt, n=2**14, r=8, p=1)
+                  key = self._key_cache[device_serial] = kdf.derive(self.psk)
+              return key
 
           def _decrypt_payload(self, encrypted_data: str, device_serial: str):
               key = self._derive_device_key(device_serial)
-              encrypted_payload = base64.b64decode(encrypted_data.encode())
+              encrypted_payload = memoryview(base64.b64decode(encrypted_data))
+              # nonce || ciphertext || tag; AESGCM takes the tag appended,
+              # so both parts are passed as views rather than copies
               nonce = encrypted_payload[:12]
-              tag = encrypted_payload[-16:]
-              ciphertext = encrypted_payload[12:-16]
-              cipher = Cipher(algorithms.AES(key), modes.GCM(nonce, tag))
-              decryptor = cipher.decryptor()
-              plaintext = decryptor.update(ciphertext) + decryptor.finalize()
-              return json.loads(plaintext.decode())
+              plaintext = AESGCM(key).decrypt(nonce, encrypted_payload[12:], None)
+              # Both parsers take the UTF-8 bytes as they are
+              return _json_loads(plaintext)
 
           def register_device(self, serial: str, mac: str):
               data = f"{serial}:{mac}"
               signature = self._create_signature(data)
               payload = {"serial": serial, "mac": mac, "signature": signature}
-              response = requests.post(f"{self.server_url}/register", json=payload, timeout=30)
+              response = self._session.post(f"{self.server_url}/register", data=_json_dumps(payload),
+                                            headers=_JSON_HEADERS, timeout=30)
               response.raise_for_status()
-              result = response.json()
+              result = _json_loads(response.content)
               config = self._decrypt_payload(result['encrypted_config'], serial)
               return {'hostname': result['hostname'], 'netbird_setup_key': config['netbird_setup_key'], 'ssh_keys': config['ssh_keys'], 'ntfy_config': config.get('ntfy_config')}
 
@@ -302,9 +325,10 @@
               signature = self._create_signature(data)
               payload = {"serial": serial, "hostname": hostname, "signature": signature, "status": status, "error_message": error_message}
               try:
-                  response = requests.post(f"{self.server_url}/confirm", json=payload, timeout=30)
+                  response = self._session.post(f"{self.server_url}/confirm", data=_json_dumps(payload),
+                                                headers=_JSON_HEADERS, timeout=30)
                   response.raise_for_status()
-                  return response.json()
+                  return _json_loads(response.content)
               except Exception as e:
                   print(f"Warning: Failed to confirm bootstrap: {e}")
                   return None
@@ -0,0 +1,76 @@
+"""
+Discovery Service - Configuration Models
+========================================
+
+Single definition of the deployment configuration models, shared by
+core.py and the legacy config.py loader.
+"""
+
+from typing import List
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class _ConfigModel(BaseModel):
+    """Base for configuration sections: loaded once, shared, never mutated"""
+    model_config = ConfigDict(frozen=True, extra='ignore', validate_default=False)
+
+class DeploymentConfig(_ConfigModel):
+    name: str = Field(..., description="Hostname prefix")
+    environment: str = Field("production", description="Environment identifier")
+    description: str = Field("", description="Deployment description")
+
+class DiscoveryServiceConfig(_ConfigModel):
+    ip: str = Field("10.42.0.1", description="Discovery service IP")
+    port: int = Field(8080, description="Discovery service port")
+    psk: str = Field(..., description="Pre-shared key for authentication")
+    admin_token: str = Field("", description="Admin API token")
+
+class NetbirdConfig(_ConfigModel):
+    setup_key: str = Field(..., description="Netbird VPN setup key")
+
+class SecurityConfig(_ConfigModel):
+    max_requests_per_ip: int = Field(10, description="Max requests per IP")
+    max_requests_per_device: int = Field(3, description="Max requests per device")
+    signature_window_seconds: int = Field(300, description="HMAC signature validity window")
+
+class APIConfig(_ConfigModel):
+    host: str = Field("0.0.0.0", description="API host")
+    port: int = Field(8080, description="API port")
+    workers: int = Field(1, description="Uvicorn worker processes")
+    trusted_proxies: List[str] = Field(
+        default_factory=list,
+        description="Peer IPs whose X-Forwarded-For header is honoured"
+    )
+
+class LoggingConfig(_ConfigModel):
+    level: str = Field("INFO", description="Log level")
+    file: str = Field("logs/discovery.log", description="Log file path")
+    max_size_mb: int = Field(10, description="Max log file size in MB")
+    backup_count: int = Field(5, description="Number of backup files")
+
+class DatabaseConfig(_ConfigModel):
+    file: str = Field("data/registrations.db", description="SQLite database file")
+
+class NTFYConfig(_ConfigModel):
+    enabled: bool = Field(False, description="Enable NTFY notifications")
+    url: str = Field("", description="NTFY topic URL")
+    auth_type: str = Field("none", description="Authentication type: none, basic, bearer")
+    username: str = Field("", description="Username for basic auth")
+    password: str = Field("", description="Password for basic auth")
+    token: str = Field("", description="Bearer token")
+    priority: str = Field("default", description="Message priority")
+    tags: List[str] = Field(default_factory=lambda: ["raspberry-pi", "bootstrap"])
+    retry_attempts: int = Field(3, description="Retry attempts")
+    timeout_seconds: int = Field(10, description="Timeout in seconds")
+
+class Config(_ConfigModel):
+    deployment: DeploymentConfig
+    discovery_service: DiscoveryServiceConfig
+    netbird: NetbirdConfig
+    ssh_keys: List[str] = Field(default_factory=list, description="SSH public keys")
+    security: SecurityConfig = Field(default_factory=SecurityConfig)
+    api: APIConfig
+    logging: LoggingConfig = Field(default_factory=LoggingConfig)
+    database: DatabaseConfig
+    ntfy: NTFYConfig
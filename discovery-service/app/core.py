@@ -8,98 +8,111 @@ Can be imported independently for testing and validation.
 """
 
 import os
-import sys
+import mmap
 import time
 import json
 import hmac
 import hashlib
 import sqlite3
 import logging
-import secrets
+import queue
+import functools
+import itertools
+import threading
 from pathlib import Path
-from datetime import datetime
-from typing import Dict, Any, Optional, List
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Tuple, Union
+from collections import OrderedDict
 from contextlib import contextmanager
 
 import yaml
-from pydantic import BaseModel, Field
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+try:
+    import orjson
+    _json_dumps = orjson.dumps
+except ImportError:
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode()
+from pydantic import BaseModel, ConfigDict, Field
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
-from cryptography.hazmat.primitives import hashes
-import base64
+from binascii import b2a_base64
+
+from .config_models import (
+    DeploymentConfig, DiscoveryServiceConfig, NetbirdConfig, SecurityConfig,
+    APIConfig, LoggingConfig, DatabaseConfig, NTFYConfig, Config
+)
+
+__all__ = [
+    "load_config", "config_from_dict",
+    "RegistrationRequest", "RegistrationResponse",
+    "ConfirmationRequest", "ConfirmationResponse",
+    "HealthResponse", "StatsResponse",
+    "SecurityManager", "serialize_payload_prefix",
+    "DatabaseManager", "NTFYNotifier",
+    # Configuration models, re-exported from config_models
+    "DeploymentConfig", "DiscoveryServiceConfig", "NetbirdConfig", "SecurityConfig",
+    "APIConfig", "LoggingConfig", "DatabaseConfig", "NTFYConfig", "Config",
+]
 
 
 # =============================================================================
 # Configuration Models and Loading
 # =============================================================================
 
-class DeploymentConfig(BaseModel):
-    name: str = Field(..., description="Hostname prefix")
-    environment: str = Field("production", description="Environment identifier")
-    description: str = Field("", description="Deployment description")
-
-class DiscoveryServiceConfig(BaseModel):
-    ip: str = Field("10.42.0.1", description="Discovery service IP")
-    port: int = Field(8080, description="Discovery service port")
-    psk: str = Field(..., description="Pre-shared key for authentication")
-
-class NetbirdConfig(BaseModel):
-    setup_key: str = Field(..., description="Netbird VPN setup key")
-
-class APIConfig(BaseModel):
-    host: str = Field("0.0.0.0", description="API host")
-    port: int = Field(8080, description="API port")
-
-class DatabaseConfig(BaseModel):
-    file: str = Field("data/registrations.db", description="SQLite database file")
-
-class NTFYConfig(BaseModel):
-    enabled: bool = Field(False, description="Enable NTFY notifications")
-    url: str = Field("", description="NTFY topic URL")
-    auth_type: str = Field("none", description="Authentication type: none, basic, bearer")
-    username: str = Field("", description="Username for basic auth")
-    password: str = Field("", description="Password for basic auth")
-    token: str = Field("", description="Bearer token")
-    priority: str = Field("default", description="Message priority")
-    tags: List[str] = Field(default_factory=lambda: ["raspberry-pi", "bootstrap"])
-
-class Config(BaseModel):
-    deployment: DeploymentConfig
-    discovery_service: DiscoveryServiceConfig
-    netbird: NetbirdConfig
-    ssh_keys: List[str] = Field(default_factory=list, description="SSH public keys")
-    api: APIConfig
-    database: DatabaseConfig
-    ntfy: NTFYConfig
-
 def load_config(config_path: str = None) -> Config:
     """Load configuration from unified deployment YAML file"""
-    if config_path is None:
-        # Auto-detect configuration file location
-        possible_paths = [
-            "/app/parent/.deployment.yaml",  # Docker environment
-            "../.deployment.yaml",           # Local development
-            ".deployment.yaml"               # Same directory
-        ]
-
-        config_file = None
-        for path in possible_paths:
-            if Path(path).exists():
-                config_file = Path(path)
-                break
-
-        if config_file is None:
-            raise FileNotFoundError(
-                "Configuration file not found. Please create configuration: cd .. && python3 setup_deployment.py"
-            )
-    else:
-        config_file = Path(config_path)
-        if not config_file.exists():
-            raise FileNotFoundError(f"Configuration file not found: {config_path}")
-
-    with open(config_file, 'r') as f:
-        config_data = yaml.safe_load(f)
-
+    if config_path is not None:
+        try:
+            return _load_config_file(os.path.abspath(config_path))
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Configuration file not found: {config_path}") from None
+
+    # Auto-detect configuration file location. Opening the file doubles as
+    # the existence check, and paths already loaded never touch the disk.
+    possible_paths = [
+        "/app/parent/.deployment.yaml",  # Docker environment
+        "../.deployment.yaml",           # Local development
+        ".deployment.yaml"               # Same directory
+    ]
+
+    for path in possible_paths:
+        try:
+            return _load_config_file(os.path.abspath(path))
+        except FileNotFoundError:
+            continue
+
+    raise FileNotFoundError(
+        "Configuration file not found. Please create configuration: cd .. && python3 setup_deployment.py"
+    )
+
+# Below this size a plain read() is cheaper than setting up a mapping
+_MMAP_MIN_SIZE = 64 * 1024
+
+def _parse_yaml_file(config_file: str) -> Any:
+    """Parse a YAML file, mapping it read-only when it is large"""
+    with open(config_file, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < _MMAP_MIN_SIZE:
+            # One read; libyaml decodes UTF-8 itself
+            return yaml.load(f.read(), Loader=_YamlLoader)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mmap, 'MADV_WILLNEED'):
+                # madvise advice values are not flags; issue them separately
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+                mm.madvise(mmap.MADV_WILLNEED)
+            return yaml.load(mm, Loader=_YamlLoader)
+
+@functools.lru_cache(maxsize=4)
+def _load_config_file(config_file: str) -> Config:
+    """Parse and validate a config file (cached per absolute path)"""
+    return config_from_dict(_parse_yaml_file(config_file))
+
+def config_from_dict(config_data: Dict[str, Any]) -> Config:
+    """Validate already-parsed configuration data (e.g. from tests)"""
     # Transform unified config format to discovery service format
     if 'discovery_service' in config_data:
         # This is the new unified format
@@ -110,14 +123,16 @@ def load_config(config_path: str = None) -> Config:
             'ssh_keys': config_data.get('ssh_keys', []),
             'api': {
                 'host': '0.0.0.0',  # Always bind to all interfaces in container
-                'port': config_data.get('discovery_service', {}).get('port', 8080)
+                'port': config_data.get('discovery_service', {}).get('port', 8080),
+                'workers': config_data.get('discovery_service', {}).get('workers', 1),
+                'trusted_proxies': config_data.get('discovery_service', {}).get('trusted_proxies', [])
             },
             'database': config_data.get('database', {}),
             'ntfy': config_data.get('ntfy', {})
         }
         config_data = transformed_config
 
-    return Config(**config_data)
+    return Config.model_validate(config_data)
 
 
 # =============================================================================
@@ -126,6 +141,8 @@ def load_config(config_path: str = None) -> Config:
 
 class RegistrationRequest(BaseModel):
     """Device registration request (simplified - no timestamp)"""
+    model_config = ConfigDict(extra='forbid', frozen=True)
+
     serial: str = Field(..., description="Device serial number")
     mac: str = Field(..., description="Device MAC address")
     signature: str = Field(..., description="HMAC signature")
@@ -139,6 +156,8 @@ class RegistrationResponse(BaseModel):
 
 class ConfirmationRequest(BaseModel):
     """Device confirmation request (simplified - no timestamp)"""
+    model_config = ConfigDict(extra='forbid', frozen=True)
+
     serial: str = Field(..., description="Device serial number")
     hostname: str = Field(..., description="Assigned hostname")
     signature: str = Field(..., description="HMAC signature")
@@ -171,21 +190,57 @@ class StatsResponse(BaseModel):
 class SecurityManager:
     """Simplified security operations for the discovery service"""
 
+    # Upper bound on cached per-device keys (one entry per serial)
+    KEY_CACHE_SIZE = 1024
+
     def __init__(self, psk: str):
         self.psk = psk.encode() if isinstance(psk, str) else psk
+        self._key_cache: "OrderedDict[tuple, Tuple[bytes, AESGCM]]" = OrderedDict()
+        self._key_cache_lock = threading.Lock()
+        # Keyed HMAC state with the inner/outer pads already absorbed
+        self._hmac_base = hmac.new(self.psk, digestmod=hashlib.sha256)
 
     def verify_signature(self, data: str, signature: str) -> bool:
         """Verify HMAC signature (simplified - no timestamp validation)"""
-        expected_signature = hmac.new(
-            self.psk,
-            data.encode(),
-            hashlib.sha256
-        ).hexdigest()
+        return self._verify_bytes(data.encode(), signature)
+
+    def _verify_bytes(self, message: bytes, signature: str) -> bool:
+        """Verify HMAC signature over an already-encoded message"""
+        try:
+            provided = bytes.fromhex(signature)
+        except ValueError:
+            return False
 
-        # Constant-time comparison
-        return hmac.compare_digest(signature, expected_signature)
+        mac = self._hmac_base.copy()
+        mac.update(message)
+
+        # Constant-time comparison of the raw digests
+        return hmac.compare_digest(provided, mac.digest())
 
     def derive_device_key(self, device_serial: str, salt_size: int = 32) -> bytes:
+        """Derive device-specific encryption key (cached per serial)"""
+        return self._device_key_entry(device_serial, salt_size)[0]
+
+    def _device_key_entry(self, device_serial: str, salt_size: int = 32) -> Tuple[bytes, AESGCM]:
+        """Return the cached (key, AESGCM) pair for a device, deriving on miss"""
+        cache_key = (device_serial, salt_size)
+        with self._key_cache_lock:
+            entry = self._key_cache.get(cache_key)
+            if entry is not None:
+                self._key_cache.move_to_end(cache_key)
+                return entry
+
+        # Derive outside the lock so concurrent registrations don't serialize
+        key = self._derive_device_key(device_serial, salt_size)
+        entry = (key, AESGCM(key))
+
+        with self._key_cache_lock:
+            self._key_cache[cache_key] = entry
+            if len(self._key_cache) > self.KEY_CACHE_SIZE:
+                self._key_cache.popitem(last=False)
+        return entry
+
+    def _derive_device_key(self, device_serial: str, salt_size: int) -> bytes:
         """Derive device-specific encryption key using Scrypt KDF"""
         salt = device_serial.encode().ljust(salt_size, b'\x00')[:salt_size]
 
@@ -199,51 +254,131 @@ class SecurityManager:
 
         return kdf.derive(self.psk)
 
-    def encrypt_payload(self, data: Dict[str, Any], device_serial: str) -> str:
-        """Encrypt payload for specific device using AES-256-GCM"""
-        key = self.derive_device_key(device_serial)
+    def encrypt_payload(self, data: Union[Dict[str, Any], bytes], device_serial: str) -> str:
+        """Encrypt payload for specific device using AES-256-GCM
+
+        data may be a dict, or the payload already serialized to JSON bytes.
+        """
+        _, aead = self._device_key_entry(device_serial)
 
         # Generate random nonce
-        nonce = secrets.token_bytes(12)  # 96-bit nonce for GCM
+        nonce = os.urandom(12)  # 96-bit nonce for GCM (CSPRNG)
 
-        # Encrypt data
-        plaintext = json.dumps(data).encode()
-        cipher = Cipher(algorithms.AES(key), modes.GCM(nonce))
-        encryptor = cipher.encryptor()
-        ciphertext = encryptor.update(plaintext) + encryptor.finalize()
+        # Encrypt data (one-shot AEAD; output is ciphertext + 16-byte tag)
+        plaintext = data if isinstance(data, bytes) else _json_dumps(data)
+        ciphertext = aead.encrypt(nonce, plaintext, None)
 
         # Combine nonce + ciphertext + tag
-        encrypted_payload = nonce + ciphertext + encryptor.tag
+        encrypted_payload = nonce + ciphertext
 
         # Base64 encode for transport
-        return base64.b64encode(encrypted_payload).decode()
+        return b2a_base64(encrypted_payload, newline=False).decode('ascii')
 
     def verify_registration_request(self, serial: str, mac: str, signature: str) -> bool:
         """Verify device registration request (simplified)"""
-        data = f"{serial}:{mac}"
-        return self.verify_signature(data, signature)
+        return self._verify_bytes(serial.encode() + b":" + mac.encode(), signature)
 
     def verify_confirmation_request(self, serial: str, hostname: str, signature: str) -> bool:
         """Verify device confirmation request (simplified)"""
-        data = f"{serial}:{hostname}"
-        return self.verify_signature(data, signature)
+        return self._verify_bytes(serial.encode() + b":" + hostname.encode(), signature)
+
+
+def serialize_payload_prefix(data: Dict[str, Any]) -> bytes:
+    """Serialize a non-empty dict as a JSON object left open for more fields
+
+    Append b',"key":value}' to the result to complete it.
+    """
+    return _json_dumps(data)[:-1]
 
 
 # =============================================================================
 # Simplified Database Manager
 # =============================================================================
 
+# Hot-path statements, kept as constants so every call hands sqlite3's
+# per-connection statement cache the same SQL text
+
+_SQL_SELECT_HOSTNAME = "SELECT hostname FROM registrations WHERE serial = ?"
+
+_SQL_SELECT_DEVICE = "SELECT * FROM registrations WHERE serial = ?"
+
+# registered_at is set explicitly rather than left to the column default:
+# tables created by older versions still default to CURRENT_TIMESTAMP text
+_SQL_INSERT_REGISTRATION = """
+    INSERT INTO registrations (serial, mac, hostname, registered_at)
+    VALUES (?, ?, ?, CAST(strftime('%s', 'now') AS INTEGER))
+"""
+
+_SQL_INSERT_REGISTRATION_IF_NEW = """
+    INSERT INTO registrations (serial, mac, hostname, registered_at)
+    VALUES (?, ?, ?, CAST(strftime('%s', 'now') AS INTEGER))
+    ON CONFLICT DO NOTHING
+"""
+
+_SQL_CLAIM_HOSTNAME = """
+    INSERT INTO hostname_counters (prefix, next_counter) VALUES (?, 2)
+    ON CONFLICT(prefix) DO UPDATE SET next_counter = next_counter + 1
+    RETURNING next_counter - 1
+"""
+
+_SQL_CONFIRM_DEVICE = """
+    UPDATE registrations
+    SET confirmed_at = CAST(strftime('%s', 'now') AS INTEGER), status = ?
+    WHERE serial = ?
+"""
+
+_SQL_STATISTICS = """
+    SELECT COUNT(*) AS total,
+           COUNT(confirmed_at) AS confirmed,
+           MAX(CASE WHEN typeof(registered_at) = 'text'
+                    THEN CAST(strftime('%s', registered_at) AS INTEGER)
+                    ELSE registered_at END) AS last_reg
+    FROM registrations
+"""
+
+_SQL_COUNT_REGISTRATIONS = "SELECT COUNT(*) FROM registrations"
+
 class DatabaseManager:
     """Simplified SQLite database operations for device registrations"""
 
+    # Reader connections; writes all go through one dedicated connection
+    POOL_SIZE = 10
+    COUNT_CACHE_TTL = 1.0
+    # Refresh planner statistics every this many write transactions
+    OPTIMIZE_INTERVAL = 1000
+
     def __init__(self, db_path: str):
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # SQLite admits one writer at a time; queueing writers on a lock
+        # here is cheaper than having them spin on the busy timeout
+        self._writer = self._open_connection()
+        self._writer_lock = threading.Lock()
+        self._writes = itertools.count(1)
+        # (count, monotonic expiry) for get_registration_count
+        self._count_cache: Tuple[int, float] = (0, 0.0)
         self._init_database()
 
+        # WAL readers never block the writer or each other. LIFO keeps the
+        # most recently used connections, and their page caches, in rotation
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        for _ in range(self.POOL_SIZE):
+            self._pool.put(self._open_connection())
+
     def _init_database(self):
-        """Initialize simplified database schema (single table)"""
-        with self._get_connection() as conn:
+        """Initialize simplified database schema"""
+        # Settings stored in the database file itself; both must be issued
+        # outside a transaction, and auto_vacuum only takes effect before
+        # the first table is created
+        with self._borrow_connection(write=True) as conn:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+
+        with self._get_connection(immediate=True) as conn:
+            has_counters = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'hostname_counters'"
+            ).fetchone() is not None
+
             # Create table
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS registrations (
@@ -251,103 +386,206 @@ class DatabaseManager:
                     serial TEXT UNIQUE NOT NULL,
                     mac TEXT NOT NULL,
                     hostname TEXT UNIQUE NOT NULL,
-                    registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    confirmed_at TIMESTAMP NULL,
+                    registered_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+                    confirmed_at INTEGER NULL,
                     status TEXT DEFAULT 'pending'
                 )
             """)
 
-            # Create indexes separately
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_registrations_serial ON registrations(serial)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_registrations_hostname ON registrations(hostname)")
+            # Timestamps are stored as epoch seconds; convert rows written
+            # by older versions as CURRENT_TIMESTAMP text
+            for column in ('registered_at', 'confirmed_at'):
+                conn.execute(
+                    f"UPDATE registrations SET {column} = CAST(strftime('%s', {column}) AS INTEGER) "
+                    f"WHERE typeof({column}) = 'text'"
+                )
 
-    @contextmanager
-    def _get_connection(self):
-        """Context manager for database connections"""
-        conn = sqlite3.connect(self.db_path, timeout=30.0)
+            # Create indexes separately. serial and hostname are UNIQUE, so
+            # SQLite already indexes both; a second copy only adds write cost
+            conn.execute("DROP INDEX IF EXISTS idx_registrations_serial")
+            conn.execute("DROP INDEX IF EXISTS idx_registrations_hostname")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_registrations_confirmed ON registrations(confirmed_at) "
+                "WHERE confirmed_at IS NOT NULL"
+            )
+
+            # Next hostname counter per prefix
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS hostname_counters (
+                    prefix TEXT PRIMARY KEY,
+                    next_counter INTEGER NOT NULL
+                )
+            """)
+
+            if not has_counters:
+                self._seed_hostname_counters(conn)
+
+    def _seed_hostname_counters(self, conn: sqlite3.Connection):
+        """Seed hostname counters from hostnames assigned before the table existed"""
+        highest: Dict[str, int] = {}
+        for row in conn.execute("SELECT hostname FROM registrations"):
+            prefix, _, counter_part = row['hostname'].rpartition('-')
+            try:
+                counter = int(counter_part)
+            except ValueError:
+                continue
+            if prefix and counter > highest.get(prefix, 0):
+                highest[prefix] = counter
+
+        conn.executemany(
+            "INSERT INTO hostname_counters (prefix, next_counter) VALUES (?, ?)",
+            [(prefix, counter + 1) for prefix, counter in highest.items()]
+        )
+
+    def _open_connection(self) -> sqlite3.Connection:
+        """Open a long-lived connection with per-connection settings"""
+        # Autocommit at the driver level; transactions are explicit below.
+        # timeout doubles as the busy timeout (30000 ms). Connections move
+        # between threads but are only ever used by one at a time.
+        conn = sqlite3.connect(
+            self.db_path, timeout=30.0, isolation_level=None,
+            check_same_thread=False, cached_statements=256
+        )
         conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-64000")
+        conn.execute("PRAGMA mmap_size=268435456")
+        return conn
+
+    @contextmanager
+    def _borrow_connection(self, write: bool = False):
+        """Hold the writer connection, or check a reader out of the pool"""
+        if write:
+            with self._writer_lock:
+                yield self._writer
+                if next(self._writes) % self.OPTIMIZE_INTERVAL == 0:
+                    self._writer.execute("PRAGMA optimize")
+            return
+
+        conn = self._pool.get()
         try:
             yield conn
-            conn.commit()
-        except Exception:
-            conn.rollback()
-            raise
         finally:
-            conn.close()
+            self._pool.put(conn)
+
+    def close(self):
+        """Refresh planner statistics and close every connection"""
+        for _ in range(self.POOL_SIZE):
+            self._pool.get().close()
+        with self._writer_lock:
+            try:
+                self._writer.execute("PRAGMA optimize")
+            finally:
+                self._writer.close()
+
+    @contextmanager
+    def _get_connection(self, immediate: bool = False):
+        """Context manager for a transaction
+
+        Writers pass immediate=True: they run on the single writer
+        connection, and the write lock is taken at BEGIN, so a
+        read-then-write transaction cannot race a writer in another
+        process either. Readers get a pooled connection.
+        """
+        with self._borrow_connection(write=immediate) as conn:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
 
     def get_next_hostname(self, prefix: str) -> str:
-        """Get next available hostname with given prefix (simplified logic)"""
-        with self._get_connection() as conn:
-            # Find highest existing counter for this prefix
-            result = conn.execute(
-                "SELECT hostname FROM registrations WHERE hostname LIKE ? ORDER BY hostname DESC LIMIT 1",
-                (f"{prefix}-%",)
-            ).fetchone()
-
-            if result:
-                # Extract counter from last hostname
-                try:
-                    last_hostname = result['hostname']
-                    counter_part = last_hostname.split('-')[-1]
-                    counter = int(counter_part) + 1
-                except (ValueError, IndexError):
-                    counter = 1
-            else:
-                counter = 1
-
-            return f"{prefix}-{counter:02d}"
+        """Reserve the next hostname for the given prefix
+
+        The counter advances on every call, whether or not the name is
+        registered afterwards; it is not a preview. To assign and register
+        in one step use allocate_and_register.
+        """
+        with self._get_connection(immediate=True) as conn:
+            return self._claim_hostname(conn, prefix)
+
+    def _claim_hostname(self, conn: sqlite3.Connection, prefix: str) -> str:
+        """Atomically claim the current counter for prefix and advance it"""
+        counter = conn.execute(_SQL_CLAIM_HOSTNAME, (prefix,)).fetchone()[0]
+
+        return f"{prefix}-{counter:02d}"
+
+    def allocate_and_register(self, prefix: str, serial: str, mac: str) -> str:
+        """Assign the next hostname and register the device in one transaction
+
+        Returns the device's hostname; if the serial is already registered,
+        its existing hostname is returned and no counter is consumed.
+        """
+        with self._get_connection(immediate=True) as conn:
+            existing = conn.execute(_SQL_SELECT_HOSTNAME, (serial,)).fetchone()
+            if existing:
+                return existing['hostname']
+
+            hostname = self._claim_hostname(conn, prefix)
+            conn.execute(_SQL_INSERT_REGISTRATION, (serial, mac, hostname))
+            return hostname
 
     def register_device(self, serial: str, mac: str, hostname: str) -> bool:
-        """Register a new device (simplified)"""
-        try:
-            with self._get_connection() as conn:
-                conn.execute("""
-                    INSERT INTO registrations (serial, mac, hostname)
-                    VALUES (?, ?, ?)
-                """, (serial, mac, hostname))
-                return True
-        except sqlite3.IntegrityError:
-            # Device already registered
-            return False
+        """Register a new device (simplified)
+
+        Returns False if the serial or hostname is already registered.
+        """
+        with self._get_connection(immediate=True) as conn:
+            cursor = conn.execute(_SQL_INSERT_REGISTRATION_IF_NEW, (serial, mac, hostname))
+            return cursor.rowcount > 0
 
     def confirm_device(self, serial: str, status: str) -> bool:
         """Confirm device bootstrap completion"""
-        with self._get_connection() as conn:
-            cursor = conn.execute("""
-                UPDATE registrations
-                SET confirmed_at = CURRENT_TIMESTAMP, status = ?
-                WHERE serial = ?
-            """, (status, serial))
+        with self._get_connection(immediate=True) as conn:
+            cursor = conn.execute(_SQL_CONFIRM_DEVICE, (status, serial))
             return cursor.rowcount > 0
 
-    def get_device_by_serial(self, serial: str) -> Optional[Dict[str, Any]]:
-        """Get device registration by serial number"""
+    def get_hostname_by_serial(self, serial: str) -> Optional[str]:
+        """Get the hostname assigned to a serial number, if registered"""
         with self._get_connection() as conn:
-            result = conn.execute(
-                "SELECT * FROM registrations WHERE serial = ?", (serial,)
-            ).fetchone()
-            return dict(result) if result else None
+            result = conn.execute(_SQL_SELECT_HOSTNAME, (serial,)).fetchone()
+            return result[0] if result else None
 
-    def get_statistics(self) -> Dict[str, Any]:
-        """Get registration statistics"""
+    def get_device_by_serial(self, serial: str) -> Optional[sqlite3.Row]:
+        """Get device registration by serial number (columns by name or index)"""
         with self._get_connection() as conn:
-            # Total registrations
-            total = conn.execute("SELECT COUNT(*) as count FROM registrations").fetchone()['count']
+            return conn.execute(_SQL_SELECT_DEVICE, (serial,)).fetchone()
 
-            # Confirmed devices
-            confirmed = conn.execute("""
-                SELECT COUNT(*) as count FROM registrations WHERE confirmed_at IS NOT NULL
-            """).fetchone()['count']
+    def get_registration_count(self) -> int:
+        """Total registrations, cached for COUNT_CACHE_TTL seconds
 
-            # Last registration
-            last_reg = conn.execute("""
-                SELECT registered_at FROM registrations ORDER BY registered_at DESC LIMIT 1
-            """).fetchone()
+        Health probes arrive far more often than the count changes.
+        """
+        count, expires = self._count_cache
+        now = time.monotonic()
+        if now < expires:
+            return count
 
+        with self._get_connection() as conn:
+            count = conn.execute(_SQL_COUNT_REGISTRATIONS).fetchone()[0]
+        self._count_cache = (count, now + self.COUNT_CACHE_TTL)
+        return count
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Get registration statistics"""
+        with self._get_connection() as conn:
+            row = conn.execute(_SQL_STATISTICS).fetchone()
+
+            # Epoch seconds; legacy text values are converted by the query,
+            # anything still unparseable comes back as NULL. Returned as a
+            # naive UTC datetime, as when this was read straight from
+            # CURRENT_TIMESTAMP, so /stats keeps its suffix-less format
+            last_reg = row['last_reg']
+            if last_reg:
+                last_reg = datetime.fromtimestamp(last_reg, tz=timezone.utc).replace(tzinfo=None)
             return {
-                'total_registrations': total,
-                'confirmed_devices': confirmed,
-                'last_registration': datetime.fromisoformat(last_reg['registered_at']) if last_reg else None
+                'total_registrations': row['total'],
+                'confirmed_devices': row['confirmed'],
+                'last_registration': last_reg or None
             }
 
 
@@ -358,6 +596,23 @@ class DatabaseManager:
 class NTFYNotifier:
     """Simplified NTFY notification service"""
 
+    REGISTRATION_TEMPLATE = """[DISCOVERY SERVICE]
+
+Device Information:
+• Hostname: {hostname}
+• Serial: {serial}
+• IP Address: {ip_address}
+
+Configuration Sent:
+• NTFY Notifications: {ntfy_status}
+• SSH Keys: {ssh_count} keys
+• Netbird Setup Key: {netbird_status}
+• Timestamp: {timestamp}
+
+Status: Bootstrapping in progress"""
+
+    CONFIRMATION_TEMPLATE = "Device: {hostname}\nSerial: {serial}\nStatus: {outcome}"
+
     def __init__(self, config):
         self.config = config.ntfy
         self.enabled = self.config.enabled and self.config.url
@@ -372,57 +627,62 @@ class NTFYNotifier:
             if self.config.enabled:
                 logging.warning("httpx not available, NTFY notifications disabled")
 
+        # Headers that are identical for every notification
+        self._base_headers = {
+            "Priority": self.config.priority,
+            "Tags": ",".join(self.config.tags) if self.config.tags else ""
+        }
+
+        # One pooled client for all notifications (keep-alive across posts),
+        # opened by start() once the event loop is running
+        self._client = None
+
+    async def start(self):
+        """Open the shared HTTP client"""
+        if self.enabled and self._client is None:
+            self._client = self.httpx.AsyncClient(
+                timeout=self.config.timeout_seconds,
+                limits=self.httpx.Limits(max_keepalive_connections=4)
+            )
+
+    async def aclose(self):
+        """Close the shared HTTP client"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
     async def send_notification(self, title: str, message: str):
         """Send notification to NTFY service (simplified)"""
-        if not self.enabled or not self.httpx:
+        if not self.enabled or self._client is None:
             return
 
-        headers = {
-            "Title": title,
-            "Priority": self.config.priority,
-            "Tags": ",".join(self.config.tags) if self.config.tags else ""
-        }
+        headers = self._base_headers.copy()
+        headers["Title"] = title
 
         try:
-            async with self.httpx.AsyncClient(timeout=10) as client:
-                response = await client.post(
-                    self.config.url,
-                    content=message,
-                    headers=headers
-                )
-                response.raise_for_status()
+            response = await self._client.post(
+                self.config.url,
+                content=message,
+                headers=headers
+            )
+            response.raise_for_status()
         except Exception as e:
             # Don't let notification failures break the main flow
-            logging.warning(f"NTFY notification failed: {e}")
+            logging.warning("NTFY notification failed: %s", e)
 
     async def notify_registration(self, hostname: str, serial: str, ip_address: str, config_payload: dict):
         """Notify successful device registration"""
-        import datetime
-
         title = f"Discovery Service: Device Registration ({hostname})"
 
-        # Format timestamp
-        timestamp = datetime.datetime.fromtimestamp(config_payload['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
-
-        # Build configuration summary
-        ssh_count = len(config_payload.get('ssh_keys', []))
-        ntfy_status = "Enabled" if config_payload.get('ntfy_config') else "Disabled"
-        netbird_status = "Provided" if config_payload.get('netbird_setup_key') else "Not provided"
-
-        message = f"""[DISCOVERY SERVICE]
-
-Device Information:
-• Hostname: {hostname}
-• Serial: {serial}
-• IP Address: {ip_address}
-
-Configuration Sent:
-• NTFY Notifications: {ntfy_status}
-• SSH Keys: {ssh_count} keys
-• Netbird Setup Key: {netbird_status}
-• Timestamp: {timestamp}
-
-Status: Bootstrapping in progress"""
+        message = self.REGISTRATION_TEMPLATE.format(
+            hostname=hostname,
+            serial=serial,
+            ip_address=ip_address,
+            ntfy_status="Enabled" if config_payload.get('ntfy_config') else "Disabled",
+            ssh_count=len(config_payload.get('ssh_keys', [])),
+            netbird_status="Provided" if config_payload.get('netbird_setup_key') else "Not provided",
+            timestamp=datetime.fromtimestamp(config_payload['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
+        )
 
         await self.send_notification(title, message)
 
@@ -430,8 +690,9 @@ Status: Bootstrapping in progress"""
         """Notify device bootstrap confirmation"""
         if status == "success":
             title = f"Discovery Service: Bootstrap Complete ({hostname})"
-            message = f"Device: {hostname}\nSerial: {serial}\nStatus: Bootstrap successful!"
+            outcome = "Bootstrap successful!"
         else:
             title = f"Discovery Service: Bootstrap Failed ({hostname})"
-            message = f"Device: {hostname}\nSerial: {serial}\nStatus: Bootstrap failed"
+            outcome = "Bootstrap failed"
+        message = self.CONFIRMATION_TEMPLATE.format(hostname=hostname, serial=serial, outcome=outcome)
         await self.send_notification(title, message)
@@ -15,16 +15,26 @@ Features:
 """
 
 import time
+import queue
+import atexit
+import asyncio
 import logging
-
-from fastapi import FastAPI, HTTPException, Request, status
-from fastapi.responses import JSONResponse
-from fastapi.middleware.cors import CORSMiddleware
+from logging.handlers import QueueHandler, QueueListener
+from contextlib import asynccontextmanager
+
+from fastapi import APIRouter, FastAPI, HTTPException, Request, status
+from fastapi.responses import JSONResponse, Response
+try:
+    # Needs orjson, which is optional (see requirements.txt)
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+except ImportError:
+    DefaultResponse = JSONResponse
 
 # Import all core components
 from .core import (
-    load_config, Config,
-    SecurityManager, DatabaseManager, NTFYNotifier,
+    load_config, config_from_dict,
+    SecurityManager, DatabaseManager, NTFYNotifier, serialize_payload_prefix,
     RegistrationRequest, RegistrationResponse,
     ConfirmationRequest, ConfirmationResponse,
     HealthResponse, StatsResponse
@@ -35,58 +45,187 @@ from .core import (
 # FastAPI Application
 # =============================================================================
 
-# Global variables (initialized in create_app)
-config: Config = None
-security: SecurityManager = None
-database: DatabaseManager = None
-notifier: NTFYNotifier = None
-app_start_time: float = None
+# Routes are declared once here and attached to every app create_app builds;
+# per-app components live on app.state
+router = APIRouter()
 
-def create_app(config_path: str = None) -> FastAPI:
-    """Create and configure FastAPI application"""
-    global config, security, database, notifier, app_start_time
+# /health body with HealthResponse's fixed fields baked in; only the uptime
+# and the registration count are filled in per probe
+_HEALTH_TEMPLATE = (
+    '{"status":"%s","version":"%s",' % (
+        HealthResponse.model_fields['status'].default,
+        HealthResponse.model_fields['version'].default
+    )
+    + '"uptime_seconds":%r,"total_registrations":%d}'
+)
 
+async def _run_db(fn, *args):
+    """Run a blocking DatabaseManager call on the default thread pool"""
+    return await asyncio.to_thread(fn, *args)
+
+def _notify_in_background(state, coro):
+    """Send a notification without holding up the response
+
+    The app keeps a reference to each in-flight task so it is not garbage
+    collected before it finishes, and so shutdown can wait for it.
+    """
+    task = asyncio.create_task(coro)
+    state.notification_tasks.add(task)
+    task.add_done_callback(state.notification_tasks.discard)
+
+class ClientIPMiddleware:
+    """Resolve the client address once per request into scope["client_ip"]
+
+    The address is the socket peer. X-Forwarded-For is only consulted when
+    that peer is one of the configured trusted proxies; its last entry is
+    the address the proxy itself saw, anything before it came from the
+    client. Plain ASGI, so no Request/Response objects are built around
+    the call.
+    """
+
+    def __init__(self, app, trusted_proxies=()):
+        self.app = app
+        self.trusted_proxies = frozenset(trusted_proxies)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            client = scope.get("client")
+            client_ip = client[0] if client else "unknown"
+            if client_ip in self.trusted_proxies:
+                for name, value in scope["headers"]:
+                    if name == b"x-forwarded-for":
+                        client_ip = value.rpartition(b",")[2].strip().decode("latin-1") or client_ip
+                        break
+            scope["client_ip"] = client_ip
+        await self.app(scope, receive, send)
+
+def _setup_logging():
+    """Route root logging through a queue to a listener thread, once per process
+
+    Handlers run on the listener thread so their writes never block the
+    event loop. An existing queue handler on the root logger (from an
+    earlier create_app call) is left in place. The listener belongs to
+    the process, not to any one app: it is stopped (and the queue flushed)
+    at interpreter exit, so apps may start and stop their lifespans any
+    number of times.
+    """
+    root = logging.getLogger()
+    for handler in root.handlers:
+        if isinstance(handler, QueueHandler) and getattr(handler, 'listener', None) is not None:
+            return
+
+    log_queue = queue.SimpleQueue()
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(
+        logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    )
+    queue_handler = QueueHandler(log_queue)
+    # Only merge args into the message here; the console handler applies
+    # the real format on the listener thread
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+    logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
+    if queue_handler not in root.handlers:
+        # Root logger was configured by someone else; leave it alone
+        return
+
+    listener = QueueListener(log_queue, console_handler)
+    queue_handler.listener = listener
+    listener.start()
+    atexit.register(listener.stop)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared resources on startup and release them on shutdown"""
+    state = app.state
+    # Opened here rather than in create_app so that building an app which is
+    # never served opens no database
+    state.database = await _run_db(DatabaseManager, state.config.database.file)
+    await state.notifier.start()
+    yield
+    # Let pending notifications go out before the client is closed
+    await asyncio.gather(*state.notification_tasks, return_exceptions=True)
+    await state.notifier.aclose()
+    await _run_db(state.database.close)
+
+def create_app(config_path: str = None, config_data: dict = None) -> FastAPI:
+    """Create and configure FastAPI application
+
+    config_data, when given, is used instead of a config file, so callers
+    that already hold the configuration skip the YAML round trip.
+    """
     # Load configuration
-    config = load_config(config_path)
-
-    # Initialize components
-    security = SecurityManager(config.discovery_service.psk)
-    database = DatabaseManager(config.database.file)
-    notifier = NTFYNotifier(config)
-    app_start_time = time.time()
+    if config_data is not None:
+        config = config_from_dict(config_data)
+    else:
+        config = load_config(config_path)
+
+    # Everything but the timestamp is fixed for the life of the app
+    static_payload = {
+        "netbird_setup_key": config.netbird.setup_key,
+        "ssh_keys": config.ssh_keys,
+        "ntfy_config": {
+            "url": config.ntfy.url,
+            "auth_type": config.ntfy.auth_type,
+            "username": config.ntfy.username if config.ntfy.auth_type == "basic" else "",
+            "password": config.ntfy.password if config.ntfy.auth_type == "basic" else "",
+            "token": config.ntfy.token if config.ntfy.auth_type == "bearer" else "",
+            "priority": config.ntfy.priority,
+            "tags": config.ntfy.tags
+        } if config.ntfy.enabled else None
+    }
 
     # Setup basic logging
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-
-
+    _setup_logging()
 
     # Create FastAPI app
     app = FastAPI(
         title="Simplified Discovery Service",
         description="Simplified secure device registration and configuration service",
-        version="1.0.0-simple"
+        version="1.0.0-simple",
+        default_response_class=DefaultResponse,
+        lifespan=lifespan
     )
 
-    # Add middleware
-    app.add_middleware(
-        CORSMiddleware,
-        allow_origins=["*"],
-        allow_credentials=True,
-        allow_methods=["GET", "POST"],
-        allow_headers=["*"],
-    )
+    # Initialize components (the database is opened in lifespan)
+    state = app.state
+    state.config = config
+    state.security = SecurityManager(config.discovery_service.psk)
+    state.notifier = NTFYNotifier(config)
+    state.database = None
+    state.start_time = time.time()
+    # Configuration payload minus its per-request timestamp, as a dict (for
+    # notifications) and pre-serialized (for encryption)
+    state.static_payload = static_payload
+    state.payload_prefix = serialize_payload_prefix(static_payload)
+    state.notification_tasks = set()
+
+    app.include_router(router)
+    app.add_exception_handler(Exception, global_exception_handler)
+
+    # Add middleware. No CORS: the only clients are devices and probes,
+    # never browsers.
+    app.add_middleware(ClientIPMiddleware, trusted_proxies=config.api.trusted_proxies)
 
     return app
 
-app = create_app()
+def __getattr__(name):
+    """Build the module-level `app` (for "app.main:app") on first access
+
+    Importing this module therefore needs no configuration file; callers
+    that bring their own configuration use create_app directly.
+    """
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-@app.post("/register", response_model=RegistrationResponse)
+@router.post("/register", response_model=RegistrationResponse)
 async def register_device(request: Request, reg_request: RegistrationRequest):
     """Register a new device and provide configuration (simplified)"""
-    client_ip = request.client.host
+    client_ip = request.scope["client_ip"]
+    state = request.app.state
+    security, database = state.security, state.database
 
     try:
         # Verify signature (simplified - no timestamp validation)
@@ -95,57 +234,42 @@ async def register_device(request: Request, reg_request: RegistrationRequest):
             reg_request.mac,
             reg_request.signature
         ):
-            logging.warning(f"Invalid signature from {client_ip} for device {reg_request.serial}")
+            logging.warning("Invalid signature from %s for device %s", client_ip, reg_request.serial)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid signature"
             )
 
         # Check if device already registered
-        existing_device = database.get_device_by_serial(reg_request.serial)
+        hostname = await _run_db(database.get_hostname_by_serial, reg_request.serial)
+        existing_device = hostname is not None
         if existing_device:
-            hostname = existing_device['hostname']
-            logging.info(f"Device {reg_request.serial} already registered as {hostname}")
+            logging.info("Device %s already registered as %s", reg_request.serial, hostname)
         else:
-            # Generate new hostname
-            hostname = database.get_next_hostname(config.deployment.name)
-
-            # Register device
-            success = database.register_device(reg_request.serial, reg_request.mac, hostname)
-            if not success:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Failed to register device"
-                )
-
-            logging.info(f"Registered new device {reg_request.serial} as {hostname}")
-
-        # Create encrypted configuration payload
-        config_payload = {
-            "netbird_setup_key": config.netbird.setup_key,
-            "ssh_keys": config.ssh_keys,
-            "timestamp": int(time.time()),
-            "ntfy_config": {
-                "url": config.ntfy.url,
-                "auth_type": config.ntfy.auth_type,
-                "username": config.ntfy.username if config.ntfy.auth_type == "basic" else "",
-                "password": config.ntfy.password if config.ntfy.auth_type == "basic" else "",
-                "token": config.ntfy.token if config.ntfy.auth_type == "bearer" else "",
-                "priority": config.ntfy.priority,
-                "tags": config.ntfy.tags
-            } if config.ntfy.enabled else None
-        }
+            # Assign hostname and register device
+            hostname = await _run_db(
+                database.allocate_and_register,
+                state.config.deployment.name,
+                reg_request.serial,
+                reg_request.mac
+            )
+
+            logging.info("Registered new device %s as %s", reg_request.serial, hostname)
+
+        # Create encrypted configuration payload: only the timestamp varies
+        timestamp = int(time.time())
+        payload = state.payload_prefix + b',"timestamp":%d}' % timestamp
 
         # Send notification for new devices only
         if not existing_device:
-            await notifier.notify_registration(
+            _notify_in_background(state, state.notifier.notify_registration(
                 hostname=hostname,
                 serial=reg_request.serial,
                 ip_address=client_ip,
-                config_payload=config_payload
-            )
+                config_payload={**state.static_payload, "timestamp": timestamp}
+            ))
 
-        encrypted_config = security.encrypt_payload(config_payload, reg_request.serial)
+        encrypted_config = security.encrypt_payload(payload, reg_request.serial)
 
         return RegistrationResponse(
             hostname=hostname,
@@ -155,79 +279,83 @@ async def register_device(request: Request, reg_request: RegistrationRequest):
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"Registration error for {reg_request.serial}: {str(e)}")
+        logging.error("Registration error for %s: %s", reg_request.serial, e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error"
         )
 
-@app.post("/confirm", response_model=ConfirmationResponse)
+@router.post("/confirm", response_model=ConfirmationResponse)
 async def confirm_bootstrap(request: Request, conf_request: ConfirmationRequest):
     """Confirm device bootstrap completion (simplified)"""
-    client_ip = request.client.host
+    client_ip = request.scope["client_ip"]
+    state = request.app.state
 
     try:
         # Verify signature (simplified - no timestamp validation)
-        if not security.verify_confirmation_request(
+        if not state.security.verify_confirmation_request(
             conf_request.serial,
             conf_request.hostname,
             conf_request.signature
         ):
-            logging.warning(f"Invalid confirmation signature from {client_ip} for device {conf_request.serial}")
+            logging.warning("Invalid confirmation signature from %s for device %s", client_ip, conf_request.serial)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid signature"
             )
 
         # Update device confirmation
-        success = database.confirm_device(conf_request.serial, conf_request.status)
+        success = await _run_db(state.database.confirm_device, conf_request.serial, conf_request.status)
         if not success:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Device not found"
             )
 
-        logging.info(f"Confirmed bootstrap for {conf_request.hostname} ({conf_request.serial}): {conf_request.status}")
+        logging.info(
+            "Confirmed bootstrap for %s (%s): %s",
+            conf_request.hostname, conf_request.serial, conf_request.status
+        )
 
         # Send notification
-        await notifier.notify_confirmation(
+        _notify_in_background(state, state.notifier.notify_confirmation(
             conf_request.hostname,
             conf_request.serial,
             conf_request.status
-        )
+        ))
 
         return ConfirmationResponse()
 
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"Confirmation error for {conf_request.serial}: {str(e)}")
+        logging.error("Confirmation error for %s: %s", conf_request.serial, e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error"
         )
 
-@app.get("/health", response_model=HealthResponse)
-async def health_check():
+@router.get("/health", response_model=HealthResponse)
+async def health_check(request: Request):
     """Health check endpoint"""
-    stats = database.get_statistics()
-    uptime = time.time() - app_start_time
+    state = request.app.state
+    uptime = time.time() - state.start_time
+    total = await _run_db(state.database.get_registration_count)
 
-    return HealthResponse(
-        uptime_seconds=uptime,
-        total_registrations=stats['total_registrations']
+    return Response(
+        content=(_HEALTH_TEMPLATE % (uptime, total)).encode(),
+        media_type="application/json"
     )
 
-@app.get("/stats", response_model=StatsResponse)
-async def get_stats():
+@router.get("/stats", response_model=StatsResponse)
+async def get_stats(request: Request):
     """Get registration statistics (simplified - no admin auth)"""
-    stats = database.get_statistics()
+    stats = await _run_db(request.app.state.database.get_statistics)
     return StatsResponse(**stats)
 
-@app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """Global exception handler"""
-    logging.error(f"Unhandled exception: {str(exc)}")
+    logging.error("Unhandled exception: %s", exc)
     return JSONResponse(
         status_code=500,
         content={"success": False, "error": "Internal server error"}
@@ -235,10 +363,14 @@ async def global_exception_handler(request: Request, exc: Exception):
 
 if __name__ == "__main__":
     import uvicorn
+    # Only the serving settings are needed here; uvicorn imports app.main
+    # and builds the app itself
+    config = load_config()
     uvicorn.run(
         "app.main:app",
         host=config.api.host,
         port=config.api.port,
+        workers=config.api.workers,
         reload=False,
         access_log=False
     )
@@ -18,22 +18,34 @@ import time
 import hmac
 import hashlib
 import base64
-import subprocess
 import argparse
 import logging
 from pathlib import Path
 from typing import Optional, Dict, Any
 
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
-from cryptography.hazmat.primitives import hashes
+import requests
+from urllib3.util.retry import Retry
 
 try:
-    import requests
+    # Optional; the client runs on the bootstrap image's stock Python too
+    import orjson
+
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+
+    def _json_dumps_pretty(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
 except ImportError:
-    print("Installing required packages...")
-    subprocess.run([sys.executable, "-m", "pip", "install", "requests", "cryptography"], check=True)
-    import requests
+    _json_loads = json.loads
+
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode()
+
+    def _json_dumps_pretty(obj: Any) -> bytes:
+        return json.dumps(obj, indent=2).encode()
+
+# Request bodies are serialized here, so requests is handed bytes
+_JSON_HEADERS = {"Content-Type": "application/json"}
 
 class BootstrapClient:
     """Client for discovery service integration with production features"""
@@ -44,69 +56,96 @@ class BootstrapClient:
         self.max_retries = max_retries
         self.timeout = timeout
         self.logger = logging.getLogger(__name__)
+        # Derived keys per serial; Scrypt is deliberately expensive
+        self._key_cache: Dict[str, bytes] = {}
+        # Ready AESGCM instances per serial (AES key schedule done once)
+        self._aead_cache: Dict[str, Any] = {}
+        # Keyed HMAC state with the inner/outer pads already absorbed
+        self._hmac_base = hmac.new(self.psk, digestmod=hashlib.sha256)
+
+        # One keep-alive connection pool shared by /register and /confirm.
+        # urllib3 retries connection failures and gateway errors (first
+        # retry immediately, then 2s, 4s, ...) and honours Retry-After;
+        # both endpoints are idempotent, so POST is safe to retry.
+        retry = Retry(
+            total=max(max_retries - 1, 0),
+            backoff_factor=1,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET', 'POST']),
+            raise_on_status=False
+        )
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retry)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def close(self):
+        """Close pooled connections"""
+        self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def _create_signature(self, data: str) -> str:
         """Create HMAC signature for data (simplified - no timestamp)"""
-        signature = hmac.new(self.psk, data.encode(), hashlib.sha256).hexdigest()
-        return signature
+        mac = self._hmac_base.copy()
+        mac.update(data.encode())
+        return mac.hexdigest()
 
     def _derive_device_key(self, device_serial: str) -> bytes:
-        """Derive device-specific encryption key"""
+        """Derive device-specific encryption key (cached per serial)"""
+        key = self._key_cache.get(device_serial)
+        if key is not None:
+            return key
+
         salt = device_serial.encode().ljust(32, b'\x00')[:32]
 
-        kdf = Scrypt(
-            algorithm=hashes.SHA256(),
-            length=32,
+        # Same parameters as the service's Scrypt KDF; 128 * r * n = 16 MiB
+        key = hashlib.scrypt(
+            self.psk,
             salt=salt,
             n=2**14,
             r=8,
             p=1,
+            dklen=32,
+            maxmem=64 * 1024 * 1024
         )
 
-        return kdf.derive(self.psk)
+        self._key_cache[device_serial] = key
+        return key
 
     def _decrypt_payload(self, encrypted_data: str, device_serial: str) -> dict:
         """Decrypt configuration payload"""
-        key = self._derive_device_key(device_serial)
+        aead = self._aead_cache.get(device_serial)
+        if aead is None:
+            # Imported here so startup and network setup don't wait on
+            # loading the cryptography extension
+            from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+            aead = self._aead_cache[device_serial] = AESGCM(self._derive_device_key(device_serial))
 
         try:
-            # Decode base64
-            encrypted_payload = base64.b64decode(encrypted_data.encode())
+            # Decode base64 (accepts the str directly)
+            encrypted_payload = memoryview(base64.b64decode(encrypted_data))
 
-            # Extract components
+            # Layout is nonce || ciphertext || tag; AESGCM takes the tag
+            # appended, so the remainder is passed as a view, not a copy
             nonce = encrypted_payload[:12]
-            tag = encrypted_payload[-16:]
-            ciphertext = encrypted_payload[12:-16]
+            ciphertext_and_tag = encrypted_payload[12:]
 
-            # Decrypt
-            cipher = Cipher(algorithms.AES(key), modes.GCM(nonce, tag))
-            decryptor = cipher.decryptor()
-            plaintext = decryptor.update(ciphertext) + decryptor.finalize()
+            # Decrypt and authenticate in one call
+            plaintext = aead.decrypt(nonce, ciphertext_and_tag, None)
 
-            return json.loads(plaintext.decode())
+            # Both parsers take the UTF-8 bytes as they are
+            return _json_loads(plaintext)
         except Exception as e:
             raise ValueError(f"Failed to decrypt payload: {e}")
 
-    def _make_request_with_retry(self, method: str, url: str, **kwargs) -> requests.Response:
-        """Make HTTP request with exponential backoff retry logic"""
-        for attempt in range(self.max_retries):
-            try:
-                self.logger.debug(f"Attempt {attempt + 1}/{self.max_retries}: {method} {url}")
-                response = requests.request(method, url, timeout=self.timeout, **kwargs)
-                response.raise_for_status()
-                return response
-            except (requests.exceptions.RequestException, requests.exceptions.Timeout) as e:
-                if attempt == self.max_retries - 1:
-                    self.logger.error(f"All {self.max_retries} attempts failed: {e}")
-                    raise
-
-                wait_time = 2 ** attempt  # Exponential backoff: 1s, 2s, 4s
-                self.logger.warning(f"Attempt {attempt + 1} failed: {e}. Retrying in {wait_time}s...")
-                time.sleep(wait_time)
-
     def register_device(self, serial: str, mac: str) -> Dict[str, Any]:
         """Register device with discovery service with retry logic"""
-        self.logger.info(f"Registering device {serial} with MAC {mac}")
+        self.logger.info("Registering device %s with MAC %s", serial, mac)
 
         # Create signature
         data = f"{serial}:{mac}"
@@ -119,19 +158,21 @@ class BootstrapClient:
             "signature": signature
         }
 
-        # Make request with retry
-        response = self._make_request_with_retry(
-            "POST",
+        # Make request (retries handled by the session's adapter)
+        response = self._session.post(
             f"{self.server_url}/register",
-            json=payload
+            data=_json_dumps(payload),
+            headers=_JSON_HEADERS,
+            timeout=self.timeout
         )
+        response.raise_for_status()
 
         result = response.json()
-        self.logger.debug(f"Registration response: {result}")
+        self.logger.debug("Registration response: %s", result)
 
         # Decrypt configuration
         config = self._decrypt_payload(result['encrypted_config'], serial)
-        self.logger.info(f"Successfully registered as hostname: {result['hostname']}")
+        self.logger.info("Successfully registered as hostname: %s", result['hostname'])
 
         return {
             'hostname': result['hostname'],
@@ -143,7 +184,7 @@ class BootstrapClient:
 
     def confirm_bootstrap(self, serial: str, hostname: str, status: str, error_message: str = None):
         """Confirm bootstrap completion with retry logic"""
-        self.logger.info(f"Confirming bootstrap for {hostname} ({serial}): {status}")
+        self.logger.info("Confirming bootstrap for %s (%s): %s", hostname, serial, status)
 
         # Create signature
         data = f"{serial}:{hostname}"
@@ -158,24 +199,73 @@ class BootstrapClient:
             "error_message": error_message
         }
 
-        # Make request with retry
+        # Make request (retries handled by the session's adapter)
         try:
-            response = self._make_request_with_retry(
-                "POST",
+            response = self._session.post(
                 f"{self.server_url}/confirm",
-                json=payload
+                data=_json_dumps(payload),
+                headers=_JSON_HEADERS,
+                timeout=self.timeout
             )
+            response.raise_for_status()
             result = response.json()
-            self.logger.info(f"Bootstrap confirmation successful for {hostname}")
+            self.logger.info("Bootstrap confirmation successful for %s", hostname)
             return result
         except Exception as e:
-            self.logger.warning(f"Failed to confirm bootstrap status: {e}")
+            self.logger.warning("Failed to confirm bootstrap status: %s", e)
             return None
 
+DEVICE_INFO_CACHE = "/var/lib/nixos-bootstrap/device_info.json"
+
+def _load_cached_device_info(cache_file: str = DEVICE_INFO_CACHE) -> Optional[Dict[str, str]]:
+    """Return previously detected device info if it still matches this machine
+
+    The cache lives on the SD card, which can move to another board, so
+    it is only trusted while its MAC still belongs to a local interface.
+    """
+    try:
+        with open(cache_file, 'r') as f:
+            cached = json.load(f)
+        serial, mac = cached['serial'], cached['mac']
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+    # Compared as bytes so no address has to be decoded
+    wanted = mac.encode()
+    try:
+        with os.scandir("/sys/class/net") as entries:
+            for entry in entries:
+                try:
+                    with open(f"/sys/class/net/{entry.name}/address", 'rb') as f:
+                        if f.read().strip() == wanted:
+                            return {'serial': serial, 'mac': mac}
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return None
+
+def _store_device_info(device_info: Dict[str, str], cache_file: str = DEVICE_INFO_CACHE):
+    """Persist detected device info atomically (best effort)"""
+    try:
+        cache_path = Path(cache_file)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(device_info, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logging.getLogger(__name__).debug("Could not cache device info: %s", e)
+
 def get_device_info() -> Dict[str, str]:
     """Get device serial number and MAC address with multiple fallback methods"""
     logger = logging.getLogger(__name__)
 
+    cached = _load_cached_device_info()
+    if cached is not None:
+        logger.info("Using cached device info - Serial: %s, MAC: %s", cached['serial'], cached['mac'])
+        return cached
+
     def get_serial() -> str:
         """Get device serial number with multiple fallback methods"""
         logger.debug("Attempting to detect device serial number")
@@ -187,28 +277,32 @@ def get_device_info() -> Dict[str, str]:
         ]
 
         for path in serial_paths:
-            if os.path.exists(path):
-                try:
-                    with open(path, 'r') as f:
-                        serial = f.read().strip('\x00\n')
-                        if serial:
-                            logger.debug(f"Found serial from {path}: {serial}")
-                            return serial
-                except Exception as e:
-                    logger.debug(f"Failed to read {path}: {e}")
-                    continue
+            try:
+                with open(path, 'r') as f:
+                    serial = f.read().strip('\x00\n')
+                    if serial:
+                        logger.debug("Found serial from %s: %s", path, serial)
+                        return serial
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                logger.debug("Failed to read %s: %s", path, e)
+                continue
 
         # Method 2: CPU serial from /proc/cpuinfo
         try:
-            with open("/proc/cpuinfo", 'r') as f:
-                for line in f:
-                    if line.startswith("Serial"):
-                        serial = line.split(":")[-1].strip()
-                        if serial and serial != "0000000000000000":
-                            logger.debug(f"Found CPU serial: {serial}")
-                            return serial
+            # One read and a bytes search instead of a str per line
+            data = Path("/proc/cpuinfo").read_bytes()
+            start = 0 if data.startswith(b"Serial") else data.find(b"\nSerial")
+            if start >= 0:
+                end = data.find(b"\n", start + 1)
+                line = data[start:end] if end >= 0 else data[start:]
+                serial = line.rpartition(b":")[2].strip().decode()
+                if serial and serial != "0000000000000000":
+                    logger.debug("Found CPU serial: %s", serial)
+                    return serial
         except Exception as e:
-            logger.debug(f"Failed to read /proc/cpuinfo: {e}")
+            logger.debug("Failed to read /proc/cpuinfo: %s", e)
 
         # Method 3: DMI product serial (x86/virtual machines)
         dmi_paths = [
@@ -217,28 +311,30 @@ def get_device_info() -> Dict[str, str]:
         ]
 
         for path in dmi_paths:
-            if os.path.exists(path):
-                try:
-                    with open(path, 'r') as f:
-                        serial = f.read().strip()
-                        if serial and serial not in ["", "Not Specified", "To Be Filled By O.E.M."]:
-                            logger.debug(f"Found DMI serial from {path}: {serial}")
-                            return serial
-                except Exception as e:
-                    logger.debug(f"Failed to read {path}: {e}")
+            try:
+                with open(path, 'r') as f:
+                    serial = f.read().strip()
+                    if serial and serial not in ["", "Not Specified", "To Be Filled By O.E.M."]:
+                        logger.debug("Found DMI serial from %s: %s", path, serial)
+                        return serial
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                logger.debug("Failed to read %s: %s", path, e)
 
         # Method 4: Machine ID as fallback
         machine_id_paths = ["/etc/machine-id", "/var/lib/dbus/machine-id"]
         for path in machine_id_paths:
-            if os.path.exists(path):
-                try:
-                    with open(path, 'r') as f:
-                        machine_id = f.read().strip()
-                        if machine_id:
-                            logger.warning(f"Using machine ID as serial fallback: {machine_id[:16]}...")
-                            return machine_id
-                except Exception as e:
-                    logger.debug(f"Failed to read {path}: {e}")
+            try:
+                with open(path, 'r') as f:
+                    machine_id = f.read().strip()
+                    if machine_id:
+                        logger.warning("Using machine ID as serial fallback: %s...", machine_id[:16])
+                        return machine_id
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                logger.debug("Failed to read %s: %s", path, e)
 
         raise RuntimeError("Could not determine device serial number")
 
@@ -246,55 +342,54 @@ def get_device_info() -> Dict[str, str]:
         """Get primary ethernet MAC address with fallback methods"""
         logger.debug("Attempting to detect primary MAC address")
 
+        net_dir = Path("/sys/class/net")
+
+        def read_mac(interface: str) -> Optional[str]:
+            # Only Ethernet-type links (ARPHRD_ETHER, which includes wlan)
+            # carry a 6-byte hardware address; tunnels, CAN and PPP
+            # interfaces report other types and addresses
+            try:
+                if (net_dir / interface / "type").read_text().strip() != "1":
+                    return None
+                mac = (net_dir / interface / "address").read_text().strip()
+            except OSError:
+                return None
+            if len(mac) != 17 or mac == "00:00:00:00:00:00":
+                return None
+            return mac
+
         # Method 1: Try specific ethernet interfaces
         primary_interfaces = ['eth0', 'enp0s3', 'ens160', 'ens33']
         for interface in primary_interfaces:
-            try:
-                result = subprocess.run(['ip', 'link', 'show', interface],
-                                      capture_output=True, text=True, check=True)
-                for line in result.stdout.split('\n'):
-                    if 'ether' in line:
-                        mac = line.strip().split()[1]
-                        logger.debug(f"Found MAC for {interface}: {mac}")
-                        return mac
-            except subprocess.CalledProcessError:
-                logger.debug(f"Interface {interface} not found")
-                continue
-
-        # Method 2: Get first non-loopback ethernet interface
+            mac = read_mac(interface)
+            if mac:
+                logger.debug("Found MAC for %s: %s", interface, mac)
+                return mac
+            logger.debug("Interface %s not found", interface)
+
+        # Method 2: First other ethernet interface, in name order for a
+        # stable choice across boots
         try:
-            result = subprocess.run(['ip', 'link', 'show'],
-                                  capture_output=True, text=True, check=True)
-            current_interface = None
-            for line in result.stdout.split('\n'):
-                # Look for interface name line
-                if ': ' in line and 'state' in line.lower():
-                    current_interface = line.split(':')[1].strip().split('@')[0]
-                    if 'lo' in current_interface:  # Skip loopback
-                        current_interface = None
-                        continue
-                # Look for MAC address line
-                elif 'ether' in line and current_interface and 'LOOPBACK' not in line:
-                    mac = line.strip().split()[1]
-                    logger.debug(f"Found MAC for {current_interface}: {mac}")
+            interfaces = sorted(os.listdir(net_dir))
+        except OSError as e:
+            logger.debug("Failed to read from /sys/class/net: %s", e)
+            interfaces = []
+
+        for interface in interfaces:
+            if interface.startswith(('eth', 'en')) and interface not in primary_interfaces:
+                mac = read_mac(interface)
+                if mac:
+                    logger.debug("Found MAC for %s: %s", interface, mac)
                     return mac
-        except Exception as e:
-            logger.debug(f"Failed to parse ip link output: {e}")
 
-        # Method 3: Read from /sys/class/net
-        try:
-            net_dir = Path("/sys/class/net")
-            if net_dir.exists():
-                for interface_dir in net_dir.iterdir():
-                    if interface_dir.name.startswith(('eth', 'en')) and interface_dir.name != 'lo':
-                        address_file = interface_dir / "address"
-                        if address_file.exists():
-                            mac = address_file.read_text().strip()
-                            if mac and mac != "00:00:00:00:00:00":
-                                logger.debug(f"Found MAC for {interface_dir.name}: {mac}")
-                                return mac
-        except Exception as e:
-            logger.debug(f"Failed to read from /sys/class/net: {e}")
+        # Method 3: Any other Ethernet-type interface (e.g. wlan0 on boards
+        # without ethernet)
+        for interface in interfaces:
+            if interface != 'lo' and not interface.startswith(('eth', 'en')):
+                mac = read_mac(interface)
+                if mac:
+                    logger.debug("Found MAC for %s: %s", interface, mac)
+                    return mac
 
         raise RuntimeError("Could not determine device MAC address")
 
@@ -303,10 +398,11 @@ def get_device_info() -> Dict[str, str]:
             'serial': get_serial(),
             'mac': get_mac()
         }
-        logger.info(f"Device detection successful - Serial: {device_info['serial']}, MAC: {device_info['mac']}")
+        logger.info("Device detection successful - Serial: %s, MAC: %s", device_info['serial'], device_info['mac'])
+        _store_device_info(device_info)
         return device_info
     except Exception as e:
-        logger.error(f"Device detection failed: {e}")
+        logger.error("Device detection failed: %s", e)
         raise
 
 def setup_logging(verbose: bool = False):
@@ -326,8 +422,13 @@ def write_nixos_config(config: Dict[str, Any], output_file: str = None):
     output_path = Path(output_file)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # Format SSH keys for Nix
-    ssh_keys_nix = '[\n    ' + '\n    '.join(f'"{key}"' for key in config['ssh_keys']) + '\n  ]'
+    # Format SSH keys for Nix: one join over the keys, quotes included
+    # in the separator
+    ssh_keys = config['ssh_keys']
+    if ssh_keys:
+        ssh_keys_nix = '[\n    "' + '"\n    "'.join(ssh_keys) + '"\n  ]'
+    else:
+        ssh_keys_nix = '[ ]'
 
     nix_config = f'''# Auto-generated NixOS configuration from discovery service
 # Generated at: {time.strftime('%Y-%m-%d %H:%M:%S')}
@@ -351,10 +452,9 @@ def write_nixos_config(config: Dict[str, Any], output_file: str = None):
 }}
 '''
 
-    with open(output_path, 'w') as f:
-        f.write(nix_config)
+    output_path.write_text(nix_config)
 
-    logging.getLogger(__name__).info(f"NixOS configuration written to {output_path}")
+    logging.getLogger(__name__).info("NixOS configuration written to %s", output_path)
     return str(output_path)
 
 def main():
@@ -394,12 +494,10 @@ Examples:
         print(f"📱 Device Serial: {serial}")
         print(f"🌐 MAC Address: {mac}")
 
-        # Initialize client
-        client = BootstrapClient(args.server_url, args.psk, args.retries, args.timeout)
-
-        # Register with discovery service
-        logger.info("🚀 Registering with discovery service...")
-        config = client.register_device(serial, mac)
+        # Initialize client and register with discovery service
+        with BootstrapClient(args.server_url, args.psk, args.retries, args.timeout) as client:
+            logger.info("🚀 Registering with discovery service...")
+            config = client.register_device(serial, mac)
 
         hostname = config['hostname']
         netbird_key = config['netbird_setup_key']
@@ -415,10 +513,9 @@ Examples:
         config_dir.mkdir(parents=True, exist_ok=True)
 
         json_config_file = args.output or str(config_dir / "discovery_config.json")
-        with open(json_config_file, 'w') as f:
-            json.dump(config, f, indent=2)
+        Path(json_config_file).write_bytes(_json_dumps_pretty(config))
 
-        logger.info(f"💾 JSON configuration saved to {json_config_file}")
+        logger.info("💾 JSON configuration saved to %s", json_config_file)
 
         # Save NixOS configuration if requested
         nixos_config_file = None
@@ -444,7 +541,7 @@ Examples:
         }
 
     except Exception as e:
-        logger.error(f"❌ Bootstrap client error: {e}")
+        logger.error("❌ Bootstrap client error: %s", e)
         return {
             'success': False,
             'error': str(e),
@@ -11,6 +11,7 @@ Usage:
   python3 setup_deployment.py --ntfy-test  # Test NTFY settings only
 """
 
+import os
 import argparse
 import secrets
 import json
@@ -32,6 +33,10 @@ except ImportError:
         print("   or: brew install python-yaml")
         sys.exit(1)
     import yaml
+try:
+    from yaml import CSafeLoader as _YamlLoader, CSafeDumper as _YamlDumper
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader, SafeDumper as _YamlDumper
 
 try:
     import requests
@@ -75,8 +80,8 @@ class DeploymentConfigurator:
             log_error("Please ensure you're running from the nix-sensor root directory")
             sys.exit(1)
 
-        with open(self.template_path, 'r') as f:
-            return yaml.safe_load(f)
+        with open(self.template_path, 'rb') as f:
+            return yaml.load(f, Loader=_YamlLoader)
 
     def load_config(self) -> Optional[Dict[str, Any]]:
         """Load existing deployment configuration if it exists"""
@@ -84,8 +89,8 @@ class DeploymentConfigurator:
             return None
 
         try:
-            with open(self.config_path, 'r') as f:
-                return yaml.safe_load(f)
+            with open(self.config_path, 'rb') as f:
+                return yaml.load(f, Loader=_YamlLoader)
         except Exception as e:
             log_error(f"Failed to load existing config: {e}")
             return None
@@ -93,19 +98,21 @@ class DeploymentConfigurator:
     def save_config(self, config: Dict[str, Any]):
         """Save the deployment configuration"""
         # Add metadata
+        generated_at = datetime.utcnow().isoformat() + 'Z'
         config['_metadata'] = {
-            'generated_at': datetime.utcnow().isoformat() + 'Z',
+            'generated_at': generated_at,
             'generated_by': 'setup_deployment.py',
             'version': '1.0'
         }
 
         try:
-            with open(self.config_path, 'w') as f:
-                # Write header comment
-                f.write("# Deployment Configuration - Generated by setup_deployment.py\n")
-                f.write("# DO NOT EDIT MANUALLY - Use setup_deployment.py to make changes\n")
-                f.write(f"# Generated: {datetime.utcnow().isoformat()}Z\n\n")
-                yaml.dump(config, f, default_flow_style=False, sort_keys=False)
+            # Render header comment and YAML in memory, then write once
+            self.config_path.write_text(
+                "# Deployment Configuration - Generated by setup_deployment.py\n"
+                "# DO NOT EDIT MANUALLY - Use setup_deployment.py to make changes\n"
+                f"# Generated: {generated_at}\n\n"
+                + yaml.dump(config, Dumper=_YamlDumper, default_flow_style=False, sort_keys=False)
+            )
 
             log_info(f"Configuration saved to {self.config_path}")
             return True
@@ -115,7 +122,7 @@ class DeploymentConfigurator:
 
     def generate_psk(self) -> str:
         """Generate a cryptographically secure PSK"""
-        return secrets.token_hex(32)  # 64 hex characters
+        return os.urandom(32).hex()  # 64 hex characters
 
     def generate_admin_token(self) -> str:
         """Generate a secure admin token"""